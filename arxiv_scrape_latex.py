@@ -24,10 +24,31 @@ import requests
 import re
 import os
 import tarfile
-import io
+import hashlib
 import argparse
 import sys
 
+def save_streamed_response(response, filepath, chunk_size=1 << 16):
+    """
+    Writes a streamed response to disk chunk by chunk and records its SHA-256.
+
+    The digest is written to '<filepath>.sha256' so downstream caches can tell
+    whether a re-downloaded source actually changed.
+
+    Args:
+        response (requests.Response): A response opened with stream=True.
+        filepath (str): Where to save the body.
+        chunk_size (int): Bytes read from the socket per iteration.
+    """
+    digest = hashlib.sha256()
+    with open(filepath, 'wb') as f:
+        for chunk in response.iter_content(chunk_size=chunk_size):
+            f.write(chunk)
+            digest.update(chunk)
+    with open(filepath + '.sha256', 'w') as f:
+        f.write(digest.hexdigest())
+    return digest.hexdigest()
+
 def scrape_arxiv_source(url_or_id: str, download_dir: str = 'arxiv_source'):
     """
     Downloads and extracts the LaTeX source for a given arXiv paper URL or ID.
@@ -67,44 +88,48 @@ def scrape_arxiv_source(url_or_id: str, download_dir: str = 'arxiv_source'):
         headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3'
         }
-        response = requests.get(src_url, headers=headers, allow_redirects=True)
-        response.raise_for_status()  # Raise an error for bad responses (4xx or 5xx)
-
-        content_type = response.headers.get('Content-Type', '')
-        print(f"Server responded with Content-Type: {content_type}")
-
-        if 'application/x-gzip' in content_type or 'application/x-tar' in content_type or 'application/gzip' in content_type:
-            # It's a gzipped tarball
-            print(f"Detected .tar.gz archive. Extracting to {paper_download_path}...")
-            file_like_object = io.BytesIO(response.content)
-            with tarfile.open(fileobj=file_like_object, mode='r:gz') as tar:
-                tar.extractall(path=paper_download_path)
-            print(f"Successfully extracted archive to: {paper_download_path}")
-
-        elif 'application/x-tex' in content_type or 'text/plain' in content_type:
-            # It's a single .tex file
-            print("Detected single .tex file. Saving...")
-            filename = f"{paper_dir_name}.tex"
+        # Stream the body so archives are extracted as bytes arrive instead of being buffered in memory
+        with requests.get(src_url, headers=headers, stream=True, allow_redirects=True) as response:
+            response.raise_for_status()  # Raise an error for bad responses (4xx or 5xx)
+
+            content_type = response.headers.get('Content-Type', '')
+            print(f"Server responded with Content-Type: {content_type}")
+
+            if 'application/x-gzip' in content_type or 'application/x-tar' in content_type or 'application/gzip' in content_type:
+                # It's a gzipped tarball
+                print(f"Detected .tar.gz archive. Extracting to {paper_download_path}...")
+                response.raw.decode_content = True
+                # 'r|gz' reads the archive as a forward-only stream straight from the socket
+                with tarfile.open(fileobj=response.raw, mode='r|gz') as tar:
+                    if hasattr(tarfile, 'data_filter'):
+                        # Safe extraction (Python 3.12+ and security backports)
+                        tar.extractall(path=paper_download_path, filter='data')
+                    else:
+                        tar.extractall(path=paper_download_path)
+                print(f"Successfully extracted archive to: {paper_download_path}")
+
+            elif 'application/x-tex' in content_type or 'text/plain' in content_type:
+                # It's a single .tex file
+                print("Detected single .tex file. Saving...")
+                filename = f"{paper_dir_name}.tex"
             
-            # Try to get a better filename from Content-Disposition
-            content_disposition = response.headers.get('Content-Disposition')
-            if content_disposition:
-                filename_match = re.search(r'filename="(.+?)"', content_disposition)
-                if filename_match:
-                    filename = filename_match.group(1)
-
-            filepath = os.path.join(paper_download_path, filename)
-            with open(filepath, 'wb') as f:
-                f.write(response.content)
-            print(f"Successfully saved file to: {filepath}")
-
-        else:
-            # Unknown content type
-            print(f"Warning: Unknown Content-Type '{content_type}'. Saving raw content.")
-            filepath = os.path.join(paper_download_path, 'unknown_source_file')
-            with open(filepath, 'wb') as f:
-                f.write(response.content)
-            print(f"Raw content saved to: {filepath}")
+                # Try to get a better filename from Content-Disposition
+                content_disposition = response.headers.get('Content-Disposition')
+                if content_disposition:
+                    filename_match = re.search(r'filename="(.+?)"', content_disposition)
+                    if filename_match:
+                        filename = filename_match.group(1)
+
+                filepath = os.path.join(paper_download_path, filename)
+                save_streamed_response(response, filepath)
+                print(f"Successfully saved file to: {filepath}")
+
+            else:
+                # Unknown content type
+                print(f"Warning: Unknown Content-Type '{content_type}'. Saving raw content.")
+                filepath = os.path.join(paper_download_path, 'unknown_source_file')
+                save_streamed_response(response, filepath)
+                print(f"Raw content saved to: {filepath}")
 
     except requests.exceptions.RequestException as e:
         print(f"Error fetching source: {e}", file=sys.stderr)
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+
+"""
+A batch job that computes View T relations for every pair of papers in a corpus.
+
+Instead of calling compute_view_t_metrics once per pair, all Problem/Method sections
+are embedded in one multi-process pass and every pair is scored with a single matrix product.
+
+Usage:
+    python build_graph.py [-d arxiv_source] [-m model_name] [-o view_t_relations.json]
+
+Example:
+    # Score every paper downloaded by arxiv_scrape_latex.py
+    python build_graph.py -d arxiv_source -o view_t_relations.json
+"""
+
+import os
+import json
+import argparse
+import numpy as np
+from extract_node import read_tex_file, extract_section, clean_latex
+from compute_similarity import encode_corpus, similarity_matrix, analyze_similarity
+
+def load_corpus(source_dir):
+    """
+    Extracts the Problem (Introduction) and Method sections of every paper directory in source_dir.
+    """
+    papers = []
+    for pid in sorted(os.listdir(source_dir)):
+        pdir = os.path.join(source_dir, pid)
+        if not os.path.isdir(pdir):
+            continue
+
+        tex_files = [f for f in os.listdir(pdir) if f.endswith('.tex')]
+        if not tex_files:
+            print(f"Warning: No .tex file found in {pdir}")
+            continue
+
+        # Prefer 'main.tex' (same heuristic as main.py)
+        main_tex = next((f for f in tex_files if 'main' in f), tex_files[0])
+        full_text = read_tex_file(os.path.join(pdir, main_tex), pdir)
+
+        problem = clean_latex(extract_section(full_text, "Introduction") or "")
+        method = clean_latex(extract_section(full_text, "Methodology") or extract_section(full_text, "Capabilities") or "")
+        if not problem and not method:
+            print(f"Warning: Could not extract sections for {pid}")
+            continue
+
+        papers.append({'id': pid, 'problem': problem, 'method': method})
+    return papers
+
+def build_relations(papers, model_name):
+    """
+    Scores every pair of papers and returns relation dicts (same shape as main.py's Phase 2).
+    """
+    n = len(papers)
+    texts = [p['problem'] for p in papers] + [p['method'] for p in papers]
+
+    print(f"Encoding {len(texts)} sections for {n} papers...")
+    embeddings = encode_corpus(texts, model_name)
+    sim_prob = similarity_matrix(embeddings[:n])
+    sim_meth = similarity_matrix(embeddings[n:])
+
+    relations = []
+    rows, cols = np.triu_indices(n, k=1)
+    for i, j, prob, meth in zip(rows, cols, sim_prob[rows, cols], sim_meth[rows, cols]):
+        prob, meth = float(prob), float(meth)
+        candidates = analyze_similarity(prob, meth, verbose=False)
+        relations.append({
+            "source_id": papers[i]['id'],
+            "target_id": papers[j]['id'],
+            "relation_type": candidates[0].split(" ")[0] if candidates else "Unrelated",
+            "confidence": (prob + meth) / 2,
+            "reasoning": f"Computed via View T. Problem Sim: {prob:.2f}, Method Sim: {meth:.2f}",
+            "source": "View T"
+        })
+    return relations
+
+def main():
+    """Main function to parse command-line arguments."""
+    parser = argparse.ArgumentParser(
+        description='Compute View T relations for every pair of papers in a corpus.',
+        formatter_class=argparse.RawTextHelpFormatter
+    )
+    parser.add_argument(
+        '-d', '--dir',
+        default='arxiv_source',
+        help='Directory containing one sub-directory per paper (default: "arxiv_source").'
+    )
+    parser.add_argument(
+        '-m', '--model',
+        default='all-MiniLM-L6-v2',
+        help='SentenceTransformer model name (default: "all-MiniLM-L6-v2").'
+    )
+    parser.add_argument(
+        '-o', '--output',
+        default='view_t_relations.json',
+        help='Where to write the relations (default: "view_t_relations.json").'
+    )
+
+    args = parser.parse_args()
+
+    papers = load_corpus(args.dir)
+    if len(papers) < 2:
+        print("Not enough papers to compute relations.")
+        return
+
+    relations = build_relations(papers, args.model)
+    with open(args.output, 'w') as f:
+        json.dump(relations, f, indent=2)
+    print(f"Saved {len(relations)} relations to: {args.output}")
+
+if __name__ == '__main__':
+    main()
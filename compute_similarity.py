@@ -1,29 +1,131 @@
 import os
+import hashlib
 import numpy as np
-from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity
 from extract_relation import read_tex_file, extract_section, clean_latex
+from shared_models import load_model, encoder_backend, _cuda_available
 
-def get_embeddings(text_list, model):
+EMBED_CACHE_DIR = '_embed_cache'
+# Below this many words (e.g. a one-line fallback string) the transformer is not worth running
+MIN_WORDS_FOR_ENCODER = 20
+
+def get_embeddings(text_list, model, batch_size=32):
     """
-    Generates embeddings for a list of texts using the provided model.
+    Generates L2-normalized embeddings for a list of texts using the provided model.
     """
-    # Encode texts
-    embeddings = model.encode(text_list)
-    return embeddings
+    # On GPU keep batch outputs device-resident and copy the stacked result to the host once
+    on_gpu = getattr(model, 'device', None) is not None and model.device.type == 'cuda'
+
+    # Encode texts in one length-sorted batch; unit-norm outputs make cosine a plain dot product
+    embeddings = model.encode(
+        text_list,
+        batch_size=batch_size,
+        convert_to_numpy=not on_gpu,
+        convert_to_tensor=on_gpu,
+        normalize_embeddings=True,
+        show_progress_bar=False
+    )
+    if on_gpu:
+        embeddings = embeddings.float().cpu().numpy()
+    # FP16 models return half-precision arrays; accumulate dot products in FP32
+    return embeddings.astype(np.float32, copy=False)
 
-def compute_view_t_metrics(paper_a_data, paper_b_data, model_name='allenai/specter'):
+def similarity_matrix(emb_a, emb_b=None):
     """
-    Computes View T (Textual Similarity) metrics between two papers.
+    Cosine similarity of every row of emb_a against every row of emb_b (default: emb_a itself).
+    Expects L2-normalized embeddings, so the whole N x M matrix is a single GEMM.
+    """
+    emb_b = emb_a if emb_b is None else emb_b
+    return emb_a @ emb_b.T
+
+def _embedding_cache_path(model_name, backend, text, cache_dir=EMBED_CACHE_DIR):
+    key = hashlib.sha256((model_name + '\0' + backend + '\0' + text).encode('utf-8')).hexdigest()
+    return os.path.join(cache_dir, f"{key}.npy")
+
+def _encode_multi_process(text_list, model, batch_size=32):
+    """
+    Shards encoding across worker processes (one per CPU core / GPU) to sidestep the GIL.
+    """
+    # None lets SentenceTransformers use every GPU; on CPU its default is only 4 workers
+    target_devices = None if _cuda_available() else ['cpu'] * (os.cpu_count() or 1)
+    # Workers are spawned fresh and read these at torch import: one thread each, so
+    # N single-threaded workers don't oversubscribe the cores
+    saved_env = {var: os.environ.get(var) for var in ('OMP_NUM_THREADS', 'MKL_NUM_THREADS')}
+    os.environ.update({var: '1' for var in saved_env})
+    # Starting the pool moves the model to the CPU; it is the shared load_model instance,
+    # so put it back on its device for later callers
+    device = model.device
+    try:
+        pool = model.start_multi_process_pool(target_devices=target_devices)
+    finally:
+        for var, value in saved_env.items():
+            if value is None:
+                os.environ.pop(var, None)
+            else:
+                os.environ[var] = value
+    try:
+        embeddings = model.encode_multi_process(text_list, pool, batch_size=batch_size, normalize_embeddings=True)
+    finally:
+        model.stop_multi_process_pool(pool)
+        model.to(device)
+    return embeddings.astype(np.float32, copy=False)
+
+def get_cached_embeddings(text_list, model_name, cache_dir=EMBED_CACHE_DIR, multi_process=False, model=None):
+    """
+    Returns embeddings for text_list, keyed on disk by (model_name, backend, text), where the
+    backend (ONNX INT8 / torch INT8 / torch FP16) is the one load_model uses on this host.
+    The model is only loaded when at least one text is missing from the cache;
+    pass an already loaded model instance for model_name to reuse it.
+    """
+    backend = encoder_backend(model_name)
+    paths = [_embedding_cache_path(model_name, backend, text, cache_dir) for text in text_list]
+    embeddings = [np.load(path) if os.path.exists(path) else None for path in paths]
+    misses = [i for i, emb in enumerate(embeddings) if emb is None]
+
+    if not misses:
+        print("Loaded all embeddings from cache.")
+        return np.stack(embeddings)
+
+    model, loaded_name = (model, model_name) if model is not None else load_model(model_name)
+    print(f"Generating embeddings for {len(misses)}/{len(text_list)} texts...")
+    miss_texts = [text_list[i] for i in misses]
+    if multi_process and hasattr(model, 'start_multi_process_pool'):
+        new_embeddings = _encode_multi_process(miss_texts, model)
+    else:
+        new_embeddings = get_embeddings(miss_texts, model)
+
+    os.makedirs(cache_dir, exist_ok=True)
+    for i, emb in zip(misses, new_embeddings):
+        embeddings[i] = emb
+        # Key by the model that actually produced the vector (differs after a fallback)
+        np.save(_embedding_cache_path(loaded_name, backend, text_list[i], cache_dir), emb)
+    return np.stack(embeddings)
+
+def encode_corpus(texts, model_name):
+    """
+    Embeds a whole corpus of texts at once (cache misses are encoded across all CPU cores).
+    Returns an (N, dim) array of L2-normalized embeddings.
+    """
+    return get_cached_embeddings(texts, model_name, multi_process=True)
+
+def tfidf_similarity(texts):
     """
-    print(f"Loading model: {model_name}...")
+    Cheap fallback for compute_view_t_metrics: TF-IDF cosine of texts [prob_a, meth_a, prob_b, meth_b].
+    """
+    from sklearn.feature_extraction.text import TfidfVectorizer
+
     try:
-        model = SentenceTransformer(model_name)
-    except Exception as e:
-        print(f"Error loading {model_name}: {e}")
-        print("Falling back to 'all-MiniLM-L6-v2'")
-        model = SentenceTransformer('all-MiniLM-L6-v2')
+        tfidf = TfidfVectorizer().fit_transform(texts)  # Rows are L2-normalized
+    except ValueError:
+        # Empty vocabulary (all texts empty / stop words only)
+        return 0.0, 0.0
+    sims = (tfidf @ tfidf.T).toarray()
+    return float(sims[0, 2]), float(sims[1, 3])
 
+def compute_view_t_metrics(paper_a_data, paper_b_data, model_name='allenai/specter', model=None):
+    """
+    Computes View T (Textual Similarity) metrics between two papers.
+    model: optional loaded encoder for model_name (e.g. shared_models.get_st_model(model_name)).
+    """
     # Prepare texts
     texts = [
         paper_a_data['problem'],
@@ -32,31 +134,29 @@ def compute_view_t_metrics(paper_a_data, paper_b_data, model_name='allenai/spect
         paper_b_data['method']
     ]
     
-    print("Generating embeddings...")
-    embeddings = get_embeddings(texts, model)
-    
-    # Unpack embeddings
-    emb_prob_a = embeddings[0].reshape(1, -1)
-    emb_meth_a = embeddings[1].reshape(1, -1)
-    emb_prob_b = embeddings[2].reshape(1, -1)
-    emb_meth_b = embeddings[3].reshape(1, -1)
+    if min(len(t.split()) for t in texts) < MIN_WORDS_FOR_ENCODER:
+        print(f"Warning: A text has fewer than {MIN_WORDS_FOR_ENCODER} words; using TF-IDF similarity instead of {model_name}.")
+        return tfidf_similarity(texts)
+
+    embeddings = get_cached_embeddings(texts, model_name, model=model)
     
-    # Compute Similarities
-    sim_prob = cosine_similarity(emb_prob_a, emb_prob_b)[0][0]
-    sim_meth = cosine_similarity(emb_meth_a, emb_meth_b)[0][0]
+    # Compute Similarities (embeddings are normalized, so cosine == dot product; no norms or sqrt)
+    sim_prob = float(embeddings[0] @ embeddings[2])
+    sim_meth = float(embeddings[1] @ embeddings[3])
     
     # Cross similarities (optional, but useful for "Method Reuse" detection)
     # e.g. Does Method A match Problem B? (Maybe not directly comparable, but Method A description vs Method B description is key)
     
     return sim_prob, sim_meth
 
-def analyze_similarity(sim_prob, sim_meth, threshold_high=0.75, threshold_low=0.5):
+def analyze_similarity(sim_prob, sim_meth, threshold_high=0.75, threshold_low=0.5, verbose=True):
     """
     Heuristic analysis based on similarity scores.
     """
-    print("\n--- View T Analysis ---")
-    print(f"Problem Similarity: {sim_prob:.4f}")
-    print(f"Method Similarity:  {sim_meth:.4f}")
+    if verbose:
+        print("\n--- View T Analysis ---")
+        print(f"Problem Similarity: {sim_prob:.4f}")
+        print(f"Method Similarity:  {sim_meth:.4f}")
     
     candidates = []
     
@@ -77,7 +177,8 @@ def analyze_similarity(sim_prob, sim_meth, threshold_high=0.75, threshold_low=0.
     else:
         candidates.append("Loosely Related")
         
-    print(f"Heuristic Classification: {', '.join(candidates)}")
+    if verbose:
+        print(f"Heuristic Classification: {', '.join(candidates)}")
     return candidates
 
 def main():
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+
+"""
+A script to export a SentenceTransformer model to an optimized, INT8-quantized ONNX model.
+
+compute_similarity.py picks up the exported model automatically and runs it through
+ONNX Runtime instead of PyTorch.
+
+Usage:
+    python export_to_onnx.py [model_name] [-o /path/to/onnx_models]
+
+Example:
+    # Export the default paper encoder
+    python export_to_onnx.py allenai/specter
+
+    # Export the lightweight model used by main.py
+    python export_to_onnx.py all-MiniLM-L6-v2
+"""
+
+import os
+import json
+import argparse
+import torch
+from sentence_transformers import SentenceTransformer
+from sentence_transformers.models import Pooling
+from onnxruntime.transformers import optimizer
+from onnxruntime.quantization import quantize_dynamic, QuantType
+from shared_models import onnx_model_dir, ONNX_MODEL_FILE, ONNX_CONFIG_FILE
+
+class _LastHiddenState(torch.nn.Module):
+    """
+    Unwraps the Hugging Face model output so the ONNX graph has a single tensor output.
+    """
+    def __init__(self, transformer):
+        super().__init__()
+        self.transformer = transformer
+
+    def forward(self, input_ids, attention_mask):
+        return self.transformer(input_ids=input_ids, attention_mask=attention_mask)[0]
+
+def export_model(model_name, output_dir='onnx_models'):
+    """
+    Exports the transformer behind a SentenceTransformer to ONNX, applies ONNX Runtime
+    graph optimizations and dynamic INT8 quantization.
+
+    Args:
+        model_name (str): The SentenceTransformer model name or path.
+        output_dir (str): The top-level directory for exported models.
+    """
+    print(f"Loading model: {model_name}...")
+    model = SentenceTransformer(model_name, device='cpu')
+    tokenizer = model.tokenizer
+    model_dir = onnx_model_dir(model_name, output_dir)
+    os.makedirs(model_dir, exist_ok=True)
+
+    # 1. Trace the transformer with dynamic batch / sequence axes
+    raw_path = os.path.join(model_dir, 'model.onnx')
+    dummy = tokenizer(["An example sentence for tracing."], return_tensors='pt')
+    dynamic_axes = {
+        'input_ids': {0: 'batch', 1: 'sequence'},
+        'attention_mask': {0: 'batch', 1: 'sequence'},
+        'last_hidden_state': {0: 'batch', 1: 'sequence'}
+    }
+    print(f"Exporting ONNX graph to {raw_path}...")
+    torch.onnx.export(
+        _LastHiddenState(model[0].auto_model).eval(),
+        (dummy['input_ids'], dummy['attention_mask']),
+        raw_path,
+        input_names=['input_ids', 'attention_mask'],
+        output_names=['last_hidden_state'],
+        dynamic_axes=dynamic_axes,
+        opset_version=17
+    )
+
+    # 2. Fuse attention / LayerNorm / GELU subgraphs (head count and hidden size are inferred)
+    optimized_path = os.path.join(model_dir, 'model_optimized.onnx')
+    print("Optimizing graph...")
+    optimized = optimizer.optimize_model(raw_path, model_type='bert', num_heads=0, hidden_size=0)
+    optimized.save_model_to_file(optimized_path)
+
+    # 3. Dynamic INT8 quantization of the weights
+    quantized_path = os.path.join(model_dir, ONNX_MODEL_FILE)
+    print("Quantizing to INT8...")
+    quantize_dynamic(optimized_path, quantized_path, weight_type=QuantType.QInt8)
+
+    # Tokenizer + pooling settings so the runtime side reproduces SentenceTransformer.encode
+    tokenizer.save_pretrained(model_dir)
+    pooling = next((module for module in model if isinstance(module, Pooling)), None)
+    config = {
+        'model_name': model_name,
+        'pooling': 'cls' if pooling is not None and pooling.pooling_mode_cls_token else 'mean',
+        'max_seq_length': model.max_seq_length
+    }
+    with open(os.path.join(model_dir, ONNX_CONFIG_FILE), 'w') as f:
+        json.dump(config, f, indent=2)
+
+    print(f"Successfully exported model to: {quantized_path}")
+    return quantized_path
+
+def main():
+    """Main function to parse command-line arguments."""
+    parser = argparse.ArgumentParser(
+        description='Export a SentenceTransformer model to a quantized ONNX model.',
+        formatter_class=argparse.RawTextHelpFormatter
+    )
+    parser.add_argument(
+        'model_name',
+        nargs='?',
+        default='allenai/specter',
+        help='The SentenceTransformer model name (default: "allenai/specter").'
+    )
+    parser.add_argument(
+        '-o', '--output-dir',
+        default='onnx_models',
+        help='Directory to save exported models (default: "onnx_models").'
+    )
+
+    args = parser.parse_args()
+
+    export_model(args.model_name, args.output_dir)
+
+if __name__ == '__main__':
+    main()
@@ -1,11 +1,84 @@
 import os
 import re
 import json
+import functools
+from concurrent.futures import ThreadPoolExecutor
 
-def read_tex_file(file_path, base_dir):
+try:
+    import hyperscan
+except ImportError:  # Optional: DFA multi-pattern matcher for large documents
+    hyperscan = None
+
+# Precompiled patterns (avoid re-parsing on every call / recursion)
+_INPUT_RE = re.compile(r'\\input(?:\{([^}]+)\}|\s+([^\s}]+))')
+# Single-pass LaTeX cleaner: one alternation, dispatched on the matched group name
+_CLEAN_RE = re.compile(
+    r'(?P<comment>%[^\n]*)'
+    r'|(?P<cite>\\cite[pt]?\{[^}\n]*\})'
+    r'|(?P<ref>\\ref\{[^}\n]*\})'
+    r'|(?P<cmdarg>\\[a-zA-Z]+\{(?P<arg>(?:[^{}\n]|\{[^{}\n]*\})*)\})'
+    r'|(?P<cmd>\\[a-zA-Z]+)'
+)
+_WS_RE = re.compile(r'\s+')
+
+# Threads used to read sibling \input files of one document level
+_READ_WORKERS = 8
+
+# The _CLEAN_RE alternatives for hyperscan, in the same priority order. Hyperscan has no
+# lookahead, so greedy runs are closed by a delimiter (or end of data) that is left unconsumed.
+# Each entry: (pattern, number of trailing delimiter bytes to give back)
+_HS_COMMENT_ID = 0
+_HS_PATTERNS = [
+    (rb'%', 0),  # Comment start; extended to the end of the line in _hs_clean
+    (rb'\\cite[pt]?\{[^}\n]*\}', 0),
+    (rb'\\ref\{[^}\n]*\}', 0),
+    (rb'\\[a-zA-Z]+\{(?:[^{}\n]|\{[^{}\n]*\})*\}', 0),
+    (rb'\\[a-zA-Z]+[^a-zA-Z]', 1),
+    (rb'\\[a-zA-Z]+\z', 0),
+]
+
+def _build_hs_database():
+    expressions = [pattern for pattern, _ in _HS_PATTERNS]
+    db = hyperscan.Database(mode=hyperscan.HS_MODE_BLOCK)
+    db.compile(
+        expressions=expressions,
+        ids=list(range(len(expressions))),
+        elements=len(expressions),
+        flags=[hyperscan.HS_FLAG_SOM_LEFTMOST] * len(expressions)
+    )
+    return db
+
+_HS_DB = _build_hs_database() if hyperscan is not None else None
+
+# \section{Title} or \section{Title \label{...}}
+_SECTION_RE = re.compile(r'\\section\{([^}]*?)(?:\\label\{[^}]*\})?\s*\}')
+
+# Callers pull 2-3 sections from one document before moving on (two in the A/B demos),
+# so only the current documents are kept alive
+@functools.lru_cache(maxsize=2)
+def _section_spans(full_text):
+    """
+    (lowercased title, body start, body end) for every \section, found in one scan of the text.
+    A body runs until the next \section (or the end of the text).
+    """
+    matches = list(_SECTION_RE.finditer(full_text))
+    ends = [m.start() for m in matches[1:]] + [len(full_text)]
+    return [(m.group(1).lower(), m.end(), end) for m, end in zip(matches, ends)]
+
+def read_tex_file(file_path, base_dir, _memo=None):
     """
     Reads a tex file and recursively resolves \input{} commands.
+    Memoized per path within one top-level read, so files included many times (e.g. macros.tex)
+    are read once; nothing is kept across calls, so edits are always picked up.
     """
+    if _memo is None:
+        _memo = {}
+    key = (file_path, base_dir)
+    if key not in _memo:
+        _memo[key] = _read_tex_file(file_path, base_dir, _memo)
+    return _memo[key]
+
+def _read_tex_file(file_path, base_dir, memo):
     if not os.path.exists(file_path):
         # Try adding .tex extension
         if os.path.exists(file_path + ".tex"):
@@ -14,62 +87,98 @@ def read_tex_file(file_path, base_dir):
             print(f"Warning: File not found: {file_path}")
             return ""
 
-    with open(file_path, 'r', encoding='utf-8') as f:
-        content = f.read()
+    # Binary read + one decode skips the text layer's newline translation
+    with open(file_path, 'rb') as f:
+        content = f.read().decode('utf-8')
 
-    # Regex to find \input{filename}
+    # Resolve \input{filename} / \input filename, splicing included files into one join
     # Note: filename might not have .tex extension
-    input_pattern = re.compile(r'\\input\{([^}]+)\}')
-    
-    def replace_input(match):
-        sub_file = match.group(1)
-        sub_file_path = os.path.join(base_dir, sub_file)
-        return read_tex_file(sub_file_path, base_dir)
+    matches = list(_INPUT_RE.finditer(content))
+    sub_paths = [os.path.join(base_dir, m.group(1) or m.group(2)) for m in matches]
+    if len(sub_paths) > 1:
+        # Read sibling includes concurrently; file I/O releases the GIL
+        with ThreadPoolExecutor(max_workers=_READ_WORKERS) as executor:
+            sub_texts = list(executor.map(lambda path: read_tex_file(path, base_dir, memo), sub_paths))
+    else:
+        sub_texts = [read_tex_file(path, base_dir, memo) for path in sub_paths]
 
-    content = input_pattern.sub(replace_input, content)
-    return content
+    parts = []
+    last = 0
+    for match, sub_text in zip(matches, sub_texts):
+        parts.append(content[last:match.start()])
+        parts.append(sub_text)
+        last = match.end()
+    parts.append(content[last:])
+    return ''.join(parts)
 
 def extract_section(full_text, section_name):
     """
     Extracts text belonging to a specific section (e.g., Introduction).
     This is a heuristic extraction based on \section{Name}.
     """
-    # Normalize section name for regex
-    # \section{Introduction} or \section{Introduction \label{...}}
-    pattern = re.compile(r'\\section\{' + re.escape(section_name) + r'.*?\}(.*?)\\section\{', re.DOTALL | re.IGNORECASE)
-    match = pattern.search(full_text)
-    
-    if match:
-        return match.group(1).strip()
-    
-    # If it's the last section, it might not be followed by another \section
-    pattern_last = re.compile(r'\\section\{' + re.escape(section_name) + r'.*?\}(.*)', re.DOTALL | re.IGNORECASE)
-    match_last = pattern_last.search(full_text)
-    
-    if match_last:
-        return match_last.group(1).strip()
-        
-    return None
+    # Section names match as a case-insensitive prefix of the title (e.g. "Method" -> "Methodology")
+    name = section_name.lower()
+    return next((full_text[start:end].strip() for title, start, end in _section_spans(full_text)
+                 if title.startswith(name)), None)
+
+def _clean_match(match):
+    kind = match.lastgroup
+    if kind == 'comment':
+        return ''
+    if kind == 'cite':
+        return '[CITATION]'
+    if kind == 'ref':
+        return '[REF]'
+    if kind == 'cmdarg':
+        # Arguments may themselves contain commands (e.g. \textbf{\emph{x}})
+        return _CLEAN_RE.sub(_clean_match, match.group('arg'))
+    return ' '
+
+def _hs_clean(text):
+    """
+    Same result as _CLEAN_RE.sub(_clean_match, text), but the match spans come from one
+    hyperscan scan; Python's re only runs on the (short) matched spans.
+    """
+    data = text.encode('utf-8')
+    best = {}  # start offset -> (pattern id, end offset); lowest id wins, like re's alternation
+
+    def on_match(pattern_id, start, end, flags, context):
+        end -= _HS_PATTERNS[pattern_id][1]
+        if start not in best or pattern_id < best[start][0]:
+            best[start] = (pattern_id, end)
+
+    _HS_DB.scan(data, match_event_handler=on_match)
+
+    # Build the cleaned text in one bytearray; untouched runs are copied without decoding
+    out = bytearray()
+    last = 0
+    for start in sorted(best):
+        if start < last:
+            continue  # Inside a span that was already replaced
+        pattern_id, end = best[start]
+        if pattern_id == _HS_COMMENT_ID:
+            end = data.find(b'\n', start)
+            if end == -1:
+                end = len(data)
+        out += data[last:start]
+        if pattern_id != _HS_COMMENT_ID:
+            out += _CLEAN_RE.sub(_clean_match, data[start:end].decode('utf-8')).encode('utf-8')
+        last = end
+    out += data[last:]
+    return out.decode('utf-8')
 
 def clean_latex(text):
     """
     Removes basic LaTeX commands for cleaner prompt input.
     """
     if not text: return ""
-    # Remove comments
-    text = re.sub(r'%.*', '', text)
-    # Remove \cite{...}
-    text = re.sub(r'\\cite\{.*?\}', '[CITATION]', text)
-    text = re.sub(r'\\citep\{.*?\}', '[CITATION]', text)
-    text = re.sub(r'\\citet\{.*?\}', '[CITATION]', text)
-    # Remove \ref{...}
-    text = re.sub(r'\\ref\{.*?\}', '[REF]', text)
-    # Remove other commands like \textbf{}, \textit{} but keep content
-    text = re.sub(r'\\[a-zA-Z]+\{(.*?)\}', r'\1', text)
-    # Remove simple commands like \noindent
-    text = re.sub(r'\\[a-zA-Z]+', ' ', text)
+    # Strip comments, \cite/\ref and commands in one pass (keeping command arguments)
+    if _HS_DB is not None:
+        text = _hs_clean(text)
+    else:
+        text = _CLEAN_RE.sub(_clean_match, text)
     # Collapse whitespace
-    text = re.sub(r'\s+', ' ', text).strip()
+    text = _WS_RE.sub(' ', text).strip()
     return text
 
 def main():
@@ -1,4 +1,7 @@
 import os
+import csv
+import subprocess
+import numpy as np
 from neo4j import GraphDatabase
 import logging
 from dotenv import load_dotenv  # <--- IMPORT THIS
@@ -11,36 +14,69 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Rows per UNWIND transaction for the *_batch writers
+BATCH_SIZE = 5000
+
+EMBEDDING_KEYS = ("embedding_problem", "embedding_method")
+
+def normalize_embeddings(paper_data):
+    """
+    Returns a copy of paper_data with unit-length embedding vectors, so index scores are plain
+    dot products and stored vectors match the normalized query embeddings.
+    """
+    paper_data = dict(paper_data)
+    for key in EMBEDDING_KEYS:
+        if paper_data.get(key) is not None:
+            vec = np.asarray(paper_data[key], dtype=np.float32)
+            norm = np.linalg.norm(vec)
+            paper_data[key] = (vec / norm if norm > 0 else vec).tolist()
+    return paper_data
+
 class GraphLoader:
     def __init__(self, uri, user, password):
         self.driver = GraphDatabase.driver(uri, auth=(user, password))
+        # One long-lived session for all writes (avoids a pool checkout per call)
+        self.session = self.driver.session()
 
     def close(self):
+        self.session.close()
         self.driver.close()
 
     def setup_schema(self):
         """
         Creates necessary constraints and indexes.
         """
-        with self.driver.session() as session:
-            # Constraint: Paper ID must be unique
-            session.run("CREATE CONSTRAINT paper_id_unique IF NOT EXISTS FOR (p:Paper) REQUIRE p.id IS UNIQUE")
-            logger.info("Schema constraints set up.")
-            
-            # Note: Vector indexes usually require specific configuration depending on Neo4j version
-            # For Neo4j 5.x+:
+        # Constraint: Paper ID must be unique
+        self.session.run("CREATE CONSTRAINT paper_id_unique IF NOT EXISTS FOR (p:Paper) REQUIRE p.id IS UNIQUE").consume()
+        logger.info("Schema constraints set up.")
+        
+        # Note: Vector indexes usually require specific configuration depending on Neo4j version
+        # For Neo4j 5.x+ (only 'cosine' / 'euclidean' exist; vectors are unit-length at ingest,
+        # so cosine ranks exactly like an inner product):
+        for index_name, prop in [("paper_problem_embedding", "embedding_problem"),
+                                 ("paper_method_embedding", "embedding_method")]:
             try:
-                session.run("""
-                    CREATE VECTOR INDEX paper_problem_embedding IF NOT EXISTS
-                    FOR (p:Paper) ON (p.embedding_problem)
-                    OPTIONS {indexConfig: {
-                     `vector.dimensions`: 384,
-                     `vector.similarity_function`: 'cosine'
-                    }}
-                """)
-                logger.info("Vector index 'paper_problem_embedding' created.")
+                self._create_vector_index(index_name, prop, quantized=True)
             except Exception as e:
-                logger.warning(f"Could not create vector index (might be older Neo4j version): {e}")
+                # Quantized indexes need Neo4j 5.23+; retry with a plain float index
+                logger.warning(f"Could not create quantized vector index, retrying without quantization: {e}")
+                try:
+                    self._create_vector_index(index_name, prop, quantized=False)
+                except Exception as e:
+                    logger.warning(f"Could not create vector index (might be older Neo4j version): {e}")
+
+    def _create_vector_index(self, index_name, prop, quantized):
+        # Quantized indexes keep int8 vectors in the index (1/4 of the float32 footprint)
+        quantization = ",\n                 `vector.quantization.enabled`: true" if quantized else ""
+        self.session.run(f"""
+            CREATE VECTOR INDEX {index_name} IF NOT EXISTS
+            FOR (p:Paper) ON (p.{prop})
+            OPTIONS {{indexConfig: {{
+             `vector.dimensions`: 384,
+             `vector.similarity_function`: 'cosine'{quantization}
+            }}}}
+        """).consume()
+        logger.info(f"Vector index '{index_name}' created (quantized: {quantized}).")
 
     def add_paper(self, paper_data):
         """
@@ -60,9 +96,27 @@ class GraphLoader:
             p.embedding_method = $embedding_method
         RETURN p.id
         """
-        with self.driver.session() as session:
-            result = session.run(query, **paper_data)
-            logger.info(f"Upserted paper: {paper_data.get('id')}")
+        self.session.run(query, **normalize_embeddings(paper_data)).consume()
+        logger.info(f"Upserted paper: {paper_data.get('id')}")
+
+    def add_papers_batch(self, papers_list):
+        """
+        Adds or updates many Paper nodes, one round-trip per BATCH_SIZE rows.
+        papers_list: list of dicts with the same keys as add_paper.
+        """
+        query = """
+        UNWIND $rows AS row
+        MERGE (p:Paper {id: row.id})
+        SET p += row
+        """
+        self._write_batches(query, [normalize_embeddings(p) for p in papers_list])
+        logger.info(f"Upserted {len(papers_list)} papers.")
+
+    def _write_batches(self, query, rows, batch_size=BATCH_SIZE):
+        # Each chunk is its own write transaction, keeping transaction state bounded on large loads
+        for start in range(0, len(rows), batch_size):
+            chunk = rows[start:start + batch_size]
+            self.session.execute_write(lambda tx: tx.run(query, rows=chunk).consume())
 
     def add_citation(self, source_id, target_id, context=None):
         """
@@ -75,9 +129,23 @@ class GraphLoader:
         SET r.context = $context
         RETURN type(r)
         """
-        with self.driver.session() as session:
-            session.run(query, source_id=source_id, target_id=target_id, context=context)
-            logger.info(f"Added citation: {source_id} -> {target_id}")
+        self.session.run(query, source_id=source_id, target_id=target_id, context=context).consume()
+        logger.info(f"Added citation: {source_id} -> {target_id}")
+
+    def add_citations_batch(self, citations_list):
+        """
+        Adds many CITES relationships, one round-trip per BATCH_SIZE rows.
+        citations_list: list of dicts containing 'source_id', 'target_id' and optionally 'context'.
+        """
+        query = """
+        UNWIND $rows AS row
+        MATCH (source:Paper {id: row.source_id})
+        MATCH (target:Paper {id: row.target_id})
+        MERGE (source)-[r:CITES]->(target)
+        SET r.context = row.context
+        """
+        self._write_batches(query, citations_list)
+        logger.info(f"Added {len(citations_list)} citations.")
 
     def add_semantic_relation(self, source_id, target_id, relation_data):
         """
@@ -93,9 +161,88 @@ class GraphLoader:
             r.reasoning = $reasoning
         RETURN type(r)
         """
-        with self.driver.session() as session:
-            session.run(query, source_id=source_id, target_id=target_id, **relation_data)
-            logger.info(f"Added semantic relation: {source_id} -[{relation_data.get('relation_type')}]-> {target_id}")
+        self.session.run(query, source_id=source_id, target_id=target_id, **relation_data).consume()
+        logger.info(f"Added semantic relation: {source_id} -[{relation_data.get('relation_type')}]-> {target_id}")
+
+    def add_semantic_relations_batch(self, relations_list):
+        """
+        Adds many SEMANTIC_RELATION relationships, one round-trip per BATCH_SIZE rows.
+        relations_list: list of dicts containing 'source_id', 'target_id', 'relation_type',
+        'confidence', 'reasoning' and 'source'.
+        """
+        query = """
+        UNWIND $rows AS row
+        MATCH (source:Paper {id: row.source_id})
+        MATCH (target:Paper {id: row.target_id})
+        MERGE (source)-[r:SEMANTIC_RELATION {source: row.source}]->(target)
+        SET r.relation_type = row.relation_type,
+            r.confidence = row.confidence,
+            r.reasoning = row.reasoning
+        """
+        self._write_batches(query, relations_list)
+        logger.info(f"Added {len(relations_list)} semantic relations.")
+
+    def query_similar(self, embedding, k=10, index='paper_problem_embedding'):
+        """
+        Returns the top-k papers closest to embedding, scored by the Neo4j vector index.
+        Result: list of dicts with 'id' and 'score' (cosine, highest first).
+        """
+        query = """
+        CALL db.index.vector.queryNodes($idx, $k, $vec)
+        YIELD node, score
+        RETURN node.id AS id, score
+        """
+        result = self.session.run(query, idx=index, k=k, vec=np.asarray(embedding, dtype=np.float32).tolist())
+        return [record.data() for record in result]
+
+    @staticmethod
+    def export_csv(papers, citations, out_dir):
+        """
+        Writes papers.csv / cites.csv in neo4j-admin import format for the initial bulk load.
+        papers: list of dicts with the same keys as add_paper.
+        citations: list of dicts containing 'source_id', 'target_id' and optionally 'context'.
+        """
+        os.makedirs(out_dir, exist_ok=True)
+        papers_path = os.path.join(out_dir, "papers.csv")
+        cites_path = os.path.join(out_dir, "cites.csv")
+
+        # Array values use neo4j-admin's default ';' delimiter
+        with open(papers_path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(["id:ID(Paper)", "title", "year:int", "venue", "paper_type",
+                             "problem_statement", "core_method", "key_findings",
+                             "embedding_problem:float[]", "embedding_method:float[]"])
+            for p in map(normalize_embeddings, papers):
+                writer.writerow([p["id"], p.get("title"), p.get("year"), p.get("venue"), p.get("paper_type"),
+                                 p.get("problem_statement"), p.get("core_method"), p.get("key_findings"),
+                                 ";".join(map(str, p.get("embedding_problem") or [])),
+                                 ";".join(map(str, p.get("embedding_method") or []))])
+
+        with open(cites_path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow([":START_ID(Paper)", ":END_ID(Paper)", "context"])
+            for c in citations:
+                writer.writerow([c["source_id"], c["target_id"], c.get("context")])
+
+        logger.info(f"Exported {len(papers)} papers and {len(citations)} citations to {out_dir}")
+        return papers_path, cites_path
+
+    @staticmethod
+    def bulk_import(out_dir, database="neo4j", neo4j_admin="neo4j-admin"):
+        """
+        Loads the CSVs written by export_csv with the offline `neo4j-admin database import`.
+        The database must be stopped and is overwritten; run setup_schema once it is back up.
+        Use add_paper / add_papers_batch for incremental updates afterwards.
+        """
+        cmd = [
+            neo4j_admin, "database", "import", "full",
+            f"--nodes=Paper={os.path.join(out_dir, 'papers.csv')}",
+            f"--relationships=CITES={os.path.join(out_dir, 'cites.csv')}",
+            "--overwrite-destination",
+            database
+        ]
+        logger.info(f"Running: {' '.join(cmd)}")
+        subprocess.run(cmd, check=True)
 
 def main():
     # Configuration
@@ -123,7 +270,6 @@ def main():
             "embedding_problem": [0.1] * 384, # Dummy vector
             "embedding_method": [0.2] * 384
         }
-        loader.add_paper(paper_a)
         
         # 2. Create Paper B (TaxoAdapt)
         paper_b = {
@@ -138,7 +284,9 @@ def main():
             "embedding_problem": [0.3] * 384, # Dummy vector
             "embedding_method": [0.4] * 384
         }
-        loader.add_paper(paper_b)
+        
+        # Upsert both papers in one round-trip
+        loader.add_papers_batch([paper_a, paper_b])
         
         # 3. Add Semantic Relation (Result from View T / View L)
         # Based on our previous analysis, they were "Likely Unrelated", but let's add a dummy relation for demo
@@ -151,6 +299,10 @@ def main():
         loader.add_semantic_relation("2108.07258", "2506.10737", relation)
         
         print("Data loading complete.")
+        
+        # 4. Similarity lookup via the vector index (no pairwise scoring in Python)
+        for match in loader.query_similar(paper_b["embedding_problem"], k=5):
+            print(f"Similar to {paper_b['id']}: {match['id']} (Score: {match['score']:.4f})")
 
     except Exception as e:
         logger.error(f"An error occurred: {e}")
@@ -1,10 +1,18 @@
 import os
 import json
-from neo4j import GraphDatabase
-from sentence_transformers import SentenceTransformer
+import asyncio
+from collections import OrderedDict
+import numpy as np
+from neo4j import AsyncGraphDatabase
+from shared_models import get_st_model
 import logging
 from dotenv import load_dotenv  # <--- IMPORT THIS
 
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
 # --- LOAD DOTENV ---
 # This finds the .env file and loads it into os.environ
 load_dotenv()
@@ -13,88 +21,215 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Query caches in front of the vector index
+EXACT_CACHE_SIZE = 512
+SEMANTIC_CACHE_SIZE = 256
+SEMANTIC_CACHE_THRESHOLD = 0.95
+
+# Retrieved context is kept column-wise (one list per field) rather than as one dict per record.
+# Edges carry only ids / titles / relation metadata; neighbor method texts travel once per distinct
+# neighbor in subgraph['methods'] ({neighbor id: core_method}) instead of once per edge.
+ANCHOR_COLUMNS = ('id', 'title', 'problem', 'score')
+EDGE_COLUMNS = ('origin_title', 'edge_type', 'semantic_relation', 'reasoning',
+                'neighbor_id', 'neighbor_title')
+
+PROMPT_TEMPLATE = """
+You are an expert scientific assistant. Answer the user's question using the provided context from the Citation Graph.
+Use the semantic relations (e.g., Extend, Contrast, Support) to explain *how* the papers are related, not just *that* they are related.
+
+User Query: "{user_query}"
+
+{context}
+
+Answer:
+"""
+
+def run_async(coro):
+    """
+    Runs a coroutine to completion, on uvloop's faster event loop when it is installed.
+    """
+    if uvloop is not None:
+        return uvloop.run(coro)
+    return asyncio.run(coro)
+
+class FaissAnnIndex:
+    """
+    Adapts a FAISS index to GraphRAG's ann_index contract.
+    paper_ids[i] is the Paper.id of the vector FAISS stored at position i (e.g. an IndexPQ built
+    from the unit-length problem embeddings, so inner-product / L2 rankings match cosine).
+    Scores are FAISS's raw values: similarities for METRIC_INNER_PRODUCT, distances for L2.
+    """
+    def __init__(self, index, paper_ids):
+        self.index = index
+        self.paper_ids = list(paper_ids)
+
+    def search(self, query_embedding, k):
+        # FAISS expects a (n, d) float32 batch and returns 2-D (distances, positions); -1 pads short results
+        query = np.asarray(query_embedding, dtype=np.float32).reshape(1, -1)
+        distances, positions = self.index.search(query, k)
+        hits = [(self.paper_ids[pos], float(dist)) for pos, dist in zip(positions[0], distances[0]) if pos >= 0]
+        return [pid for pid, _ in hits], [dist for _, dist in hits]
+
 class GraphRAG:
-    def __init__(self, uri, user, password, embedding_model_name='all-MiniLM-L6-v2'):
-        self.driver = GraphDatabase.driver(uri, auth=(user, password))
-        self.embedding_model = SentenceTransformer(embedding_model_name)
+    def __init__(self, uri, user, password, embedding_model_name='all-MiniLM-L6-v2', embedding_model=None,
+                 ann_index=None):
+        self.driver = AsyncGraphDatabase.driver(uri, auth=(user, password))
+        # Each query opens its own session from the driver's pool: sessions are not safe for
+        # concurrent use, and gathered run_pipeline calls share this GraphRAG instance
+        self._connected = False
+        # Optional external ANN index over the problem embeddings; Neo4j then only serves the graph.
+        # Contract: search(query_embedding, k) takes a 1-D float32 vector and returns (paper ids, scores),
+        # two sequences of length <= k, best first, where the ids are Paper.id values (see FaissAnnIndex)
+        self.ann_index = ann_index
+        # Shared per-process instance (ONNX export if present, else FP16 on GPU / INT8 on CPU)
+        self.embedding_model = embedding_model or get_st_model(embedding_model_name)
+        # Normalized query -> (anchors, subgraph), and (query embedding, k, context) for paraphrase hits
+        self._exact_cache = OrderedDict()
+        self._sem_cache = []
+
+    async def close(self):
+        await self.driver.close()
 
-    def close(self):
-        self.driver.close()
+    def get_embeddings(self, texts, batch_size=64):
+        """
+        Encodes a list of texts in one batched call and returns a 2-D array of unit-norm embeddings.
+        """
+        embeddings = self.embedding_model.encode(
+            texts,
+            batch_size=batch_size,
+            convert_to_numpy=True,
+            convert_to_tensor=False,
+            normalize_embeddings=True,
+            show_progress_bar=False
+        )
+        return embeddings.astype(np.float32, copy=False)
 
     def get_embedding(self, text):
-        return self.embedding_model.encode(text).tolist()
+        # float32 ndarray; converted to a list only where it is handed to the driver
+        return self.get_embeddings([text])[0]
 
-    def retrieve_anchor_nodes(self, query_text, k=3):
+    async def retrieve_context(self, query_embedding, k=3):
         """
-        Retrieves the top-k most relevant papers using vector similarity on the problem statement.
+        Retrieves the top-k anchors (vector search on the problem statement) and their 1-hop
+        neighborhood, focusing on semantic relations, in a single round-trip.
         """
-        query_embedding = self.get_embedding(query_text)
-        
-        cypher_query = """
-        CALL db.index.vector.queryNodes('paper_problem_embedding', $k, $embedding)
-        YIELD node, score
-        RETURN node.id AS id, node.title AS title, node.problem_statement AS problem, score
-        """
-        
-        with self.driver.session() as session:
-            result = session.run(cypher_query, k=k, embedding=query_embedding)
-            anchors = [record.data() for record in result]
-            
-        logger.info(f"Retrieved {len(anchors)} anchor nodes.")
-        return anchors
-
-    def expand_subgraph(self, anchor_ids):
+        if self.ann_index is not None:
+            # ANN search is blocking native code; keep it off the event loop
+            ids, scores = await asyncio.to_thread(self.ann_index.search, query_embedding, k)
+            anchor_query = """
+            UNWIND range(0, size($ids) - 1) AS i
+            MATCH (node:Paper {id: $ids[i]})
+            WITH node, $scores[i] AS score
+            """
+            params = {'ids': list(ids), 'scores': [float(score) for score in scores]}
+        else:
+            anchor_query = """
+            CALL db.index.vector.queryNodes('paper_problem_embedding', $k, $embedding)
+            YIELD node, score
+            """
+            params = {'k': k, 'embedding': np.asarray(query_embedding).tolist()}
+
+        # Columns are built server-side; edges are collected as positional lists so NULL fields keep their slot
+        cypher_query = anchor_query + """
+        WITH collect(node) AS nodes, collect(score) AS scores
+        UNWIND nodes AS origin
+        OPTIONAL MATCH (origin)-[r]-(neighbor:Paper)
+        WITH nodes, scores, collect(CASE WHEN r IS NULL THEN NULL ELSE [
+            origin.title, type(r), r.relation_type, r.reasoning, neighbor.id, neighbor.title
+        ] END) AS edges, collect(DISTINCT neighbor) AS neighbors
+        RETURN [n IN nodes | n.id] AS id, [n IN nodes | n.title] AS title,
+               [n IN nodes | n.problem_statement] AS problem, scores AS score,
+               [e IN edges | e[0]] AS origin_title, [e IN edges | e[1]] AS edge_type,
+               [e IN edges | e[2]] AS semantic_relation, [e IN edges | e[3]] AS reasoning,
+               [e IN edges | e[4]] AS neighbor_id, [e IN edges | e[5]] AS neighbor_title,
+               [n IN neighbors | [n.id, n.core_method]] AS methods
         """
-        Retrieves the 1-hop neighborhood of the anchor nodes, focusing on semantic relations.
+
+        async with self.driver.session() as session:
+            result = await session.run(cypher_query, **params)
+            record = await result.single()
+        if record:
+            anchors = {key: record[key] for key in ANCHOR_COLUMNS}
+            subgraph = {key: record[key] for key in EDGE_COLUMNS}
+            subgraph['methods'] = dict(record['methods'])
+        else:
+            anchors = {key: [] for key in ANCHOR_COLUMNS}
+            subgraph = {key: [] for key in EDGE_COLUMNS}
+            subgraph['methods'] = {}
+
+        logger.info(f"Retrieved {len(anchors['id'])} anchor nodes, {len(subgraph['edge_type'])} subgraph edges.")
+        return anchors, subgraph
+
+    async def retrieve_context_cached(self, query_text, k=3):
         """
-        cypher_query = """
-        MATCH (origin:Paper)-[r]-(neighbor:Paper)
-        WHERE origin.id IN $anchor_ids
-        RETURN 
-            origin.title AS origin_title, 
-            type(r) AS edge_type,
-            r.relation_type AS semantic_relation,
-            r.reasoning AS reasoning,
-            neighbor.title AS neighbor_title, 
-            neighbor.problem_statement AS neighbor_problem,
-            neighbor.core_method AS neighbor_method
+        retrieve_context behind two caches: an exact match on the normalized query string,
+        then a semantic match on cached query embeddings (cosine > SEMANTIC_CACHE_THRESHOLD).
         """
-        
-        with self.driver.session() as session:
-            result = session.run(cypher_query, anchor_ids=anchor_ids)
-            subgraph = [record.data() for record in result]
-            
-        logger.info(f"Expanded subgraph contains {len(subgraph)} edges.")
-        return subgraph
+        key = (query_text.strip().lower(), k)
+        if key in self._exact_cache:
+            self._exact_cache.move_to_end(key)
+            logger.info("Context cache hit (exact).")
+            return self._exact_cache[key]
+
+        # Encode in a worker thread (PyTorch / ORT release the GIL) while the first call's
+        # Bolt handshake proceeds on the event loop
+        embeddings, _ = await asyncio.gather(
+            asyncio.to_thread(self.get_embeddings, [query_text]),
+            self._ensure_connected()
+        )
+        query_embedding = embeddings[0]
+        candidates = [(emb, context) for emb, cached_k, context in self._sem_cache if cached_k == k]
+        if candidates:
+            # Embeddings are unit-norm, so the dot product is the cosine similarity
+            sims = np.stack([emb for emb, _ in candidates]) @ query_embedding
+            best = int(np.argmax(sims))
+            if sims[best] > SEMANTIC_CACHE_THRESHOLD:
+                logger.info(f"Context cache hit (semantic, sim={sims[best]:.3f}).")
+                context = candidates[best][1]
+                self._remember(key, context)
+                return context
+
+        context = await self.retrieve_context(query_embedding, k)
+        self._remember(key, context)
+        self._sem_cache.append((query_embedding, k, context))
+        if len(self._sem_cache) > SEMANTIC_CACHE_SIZE:
+            self._sem_cache.pop(0)
+        return context
+
+    async def _ensure_connected(self):
+        if not self._connected:
+            await self.driver.verify_connectivity()
+            self._connected = True
+
+    def _remember(self, key, context):
+        self._exact_cache[key] = context
+        if len(self._exact_cache) > EXACT_CACHE_SIZE:
+            self._exact_cache.popitem(last=False)
 
     def construct_prompt(self, user_query, anchors, subgraph):
         """
         Constructs the prompt for the LLM using the retrieved graph context.
         """
-        context_str = "### Retrieved Papers (Anchors):\n"
-        for p in anchors:
-            context_str += f"- **{p['title']}** (Score: {p['score']:.2f})\n"
-            context_str += f"  Problem: {p['problem']}\n\n"
-            
-        context_str += "### Related Work (Graph Connections):\n"
-        for edge in subgraph:
-            relation = edge['semantic_relation'] if edge['semantic_relation'] else edge['edge_type']
-            context_str += f"- **{edge['origin_title']}** --[{relation}]--> **{edge['neighbor_title']}**\n"
-            if edge['reasoning']:
-                context_str += f"  Reasoning: {edge['reasoning']}\n"
-            context_str += f"  Neighbor Method: {edge['neighbor_method']}\n\n"
-            
-        prompt = f"""
-You are an expert scientific assistant. Answer the user's question using the provided context from the Citation Graph.
-Use the semantic relations (e.g., Extend, Contrast, Support) to explain *how* the papers are related, not just *that* they are related.
-
-User Query: "{user_query}"
+        # Collect fragments and join once (repeated += reallocates the growing string)
+        parts = ["### Retrieved Papers (Anchors):"]
+        parts.extend(
+            f"- **{title}** (Score: {score:.2f})\n  Problem: {problem}\n"
+            for title, score, problem in zip(anchors['title'], anchors['score'], anchors['problem'])
+        )
 
-{context_str}
+        # Resolve the per-edge fields in one pass each, then format every edge block in one comprehension
+        rels = [sem or edge_type for sem, edge_type in zip(subgraph['semantic_relation'], subgraph['edge_type'])]
+        reasons = [f"\n  Reasoning: {why}" if why else "" for why in subgraph['reasoning']]
+        methods = [subgraph['methods'].get(nid) for nid in subgraph['neighbor_id']]
+        parts.append("### Related Work (Graph Connections):")
+        parts.extend(
+            f"- **{origin}** --[{r}]--> **{neighbor}**{why}\n"
+            f"  Neighbor Method: {method}\n"
+            for origin, r, neighbor, why, method in zip(subgraph['origin_title'], rels, subgraph['neighbor_title'],
+                                                        reasons, methods)
+        )
 
-Answer:
-"""
-        return prompt
+        return PROMPT_TEMPLATE.format(user_query=user_query, context="\n".join(parts))
 
     def generate_answer(self, prompt):
         """
@@ -109,19 +244,14 @@ Answer:
         # Simulated response
         return "(This is where the LLM would generate a synthesized answer based on the prompt above.)"
 
-    def run_pipeline(self, user_query):
+    async def run_pipeline(self, user_query):
         print(f"Processing Query: '{user_query}'")
         
-        # 1. Retrieve Anchors
-        anchors = self.retrieve_anchor_nodes(user_query)
-        if not anchors:
+        # 1. Retrieve Anchors + 2. Expand Graph (one round-trip)
+        anchors, subgraph = await self.retrieve_context_cached(user_query)
+        if not anchors['id']:
             print("No relevant papers found.")
             return
-
-        anchor_ids = [a['id'] for a in anchors]
-        
-        # 2. Expand Graph
-        subgraph = self.expand_subgraph(anchor_ids)
         
         # 3. Generate Answer
         prompt = self.construct_prompt(user_query, anchors, subgraph)
@@ -129,7 +259,7 @@ Answer:
         
         return answer
 
-def main():
+async def _demo():
     # Configuration
     uri = os.getenv("NEO4J_URI", "bolt://localhost:7687")
     user = os.getenv("NEO4J_USER", "neo4j")
@@ -143,13 +273,16 @@ def main():
         
         # Note: This will likely return empty results if the Neo4j DB is empty or not running.
         # To see it work, ensure graph_loader.py has been run against a live DB.
-        rag.run_pipeline(query)
+        await rag.run_pipeline(query)
         
     except Exception as e:
         logger.error(f"Error: {e}")
         print("\nNOTE: Ensure Neo4j is running and populated (run graph_loader.py first).")
     finally:
-        rag.close()
+        await rag.close()
+
+def main():
+    run_async(_demo())
 
 if __name__ == "__main__":
     main()
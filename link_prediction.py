@@ -7,6 +7,11 @@ import torch_geometric.transforms as T
 from sklearn.metrics import roc_auc_score
 import numpy as np
 
+try:
+    from torcheval.metrics.functional import binary_auroc
+except ImportError:
+    binary_auroc = None
+
 # --- 1. Model Definition ---
 
 class Net(torch.nn.Module):
@@ -22,9 +27,21 @@ class Net(torch.nn.Module):
     def decode(self, z, edge_label_index):
         return (z[edge_label_index[0]] * z[edge_label_index[1]]).sum(dim=-1)
 
-    def decode_all(self, z):
-        prob_adj = z @ z.t()
-        return (prob_adj > 0).nonzero(as_tuple=False).t()
+    def forward(self, x, edge_index, edge_label_index):
+        # Encode + decode in one call so torch.compile sees (and fuses) the whole training forward
+        return self.decode(self.encode(x, edge_index), edge_label_index)
+
+    def decode_all(self, z, block=4096, thr=0.0):
+        # Score row-blocks of Z against all nodes so only a (block x N) slice is ever materialized
+        out = []
+        zt = z.t()
+        for i in range(0, z.size(0), block):
+            pairs = (z[i:i + block] @ zt > thr).nonzero(as_tuple=False)
+            pairs[:, 0] += i
+            out.append(pairs)
+        if not out:
+            return z.new_empty((2, 0), dtype=torch.long)
+        return torch.cat(out).t()
 
 # --- 2. Data Preparation (Synthetic Demo) ---
 
@@ -57,62 +74,73 @@ def create_demo_data(num_nodes=100, num_edges=300, feature_dim=32):
 
 # --- 3. Training Loop ---
 
-def train(model, optimizer, train_data, criterion):
-    model.train()
-    optimizer.zero_grad()
-    
-    # Forward pass (Encode)
-    z = model.encode(train_data.x, train_data.edge_index)
-
-    # Negative Sampling (for training)
-    # We need negative edges (edges that don't exist) to teach the model what NOT to predict
-    neg_edge_index = negative_sampling(
-        edge_index=train_data.edge_index, num_nodes=train_data.num_nodes,
-        num_neg_samples=train_data.edge_label_index.size(1), method='sparse')
+def sample_negative_pool(data, factor=4):
+    """
+    Samples a pool of negative edges once (on the CPU) and moves it to the data's device.
+    The training graph is fixed, so epochs can draw from this pool instead of re-sampling.
+    """
+    return negative_sampling(
+        edge_index=data.edge_index, num_nodes=data.num_nodes,
+        num_neg_samples=data.edge_label_index.size(1) * factor, method='sparse').to(data.edge_index.device)
 
-    # Decode (Predict scores for positive and negative edges)
+def label_edges(data, neg_edge_index):
+    """
+    Stitches the positive supervision edges and neg_edge_index into one (edge_label_index, edge_label)
+    pair. Built once per split; training then overwrites the negative half in place.
+    """
     edge_label_index = torch.cat(
-        [train_data.edge_label_index, neg_edge_index],
+        [data.edge_label_index, neg_edge_index],
         dim=-1,
     )
     edge_label = torch.cat([
-        train_data.edge_label,
-        train_data.edge_label.new_zeros(neg_edge_index.size(1))
+        data.edge_label,
+        data.edge_label.new_zeros(neg_edge_index.size(1))
     ], dim=0)
+    return edge_label_index, edge_label
 
-    out = model.decode(z, edge_label_index)
-    
-    loss = criterion(out, edge_label)
+def train(model, optimizer, train_data, criterion, neg_pool, buffers):
+    """
+    One training step. buffers = (edge_label_index, edge_label, idx) from main(), reused every epoch.
+    """
+    edge_label_index, edge_label, idx = buffers
+    model.train()
+    optimizer.zero_grad()
+
+    # Negative Sampling (for training)
+    # We need negative edges (edges that don't exist) to teach the model what NOT to predict
+    # Draw this epoch's negatives from the pre-sampled pool straight into the label buffer
+    # (in place, no per-epoch allocations; the positive half never changes)
+    num_pos = train_data.edge_label_index.size(1)
+    idx.random_(0, neg_pool.size(1))
+    for row in range(2):
+        torch.index_select(neg_pool[row], 0, idx, out=edge_label_index[row, num_pos:])
+
+    # BF16 autocast on GPUs that support it (same exponent range as FP32, so no GradScaler needed)
+    use_bf16 = train_data.x.is_cuda and torch.cuda.is_bf16_supported()
+    with torch.autocast(device_type='cuda', dtype=torch.bfloat16, enabled=use_bf16):
+        # Forward pass (Encode + Decode: predict scores for positive and negative edges)
+        out = model(train_data.x, train_data.edge_index, edge_label_index)
+        
+        loss = criterion(out, edge_label)
     loss.backward()
     optimizer.step()
     return loss.item()
 
 # --- 4. Evaluation ---
 
-@torch.no_grad()
-def test(model, data):
+@torch.inference_mode()
+def test(model, data, edge_label_index, edge_label):
     model.eval()
     z = model.encode(data.x, data.edge_index)
     
     # Use the edges reserved for testing (positive samples)
-    # And generate negative samples
-    neg_edge_index = negative_sampling(
-        edge_index=data.edge_index, num_nodes=data.num_nodes,
-        num_neg_samples=data.edge_label_index.size(1), method='sparse')
-        
-    edge_label_index = torch.cat(
-        [data.edge_label_index, neg_edge_index],
-        dim=-1,
-    )
-    
-    edge_label = torch.cat([
-        data.edge_label,
-        data.edge_label.new_zeros(neg_edge_index.size(1))
-    ], dim=0)
-
+    # And the negative samples drawn once for this split (see label_edges)
     out = model.decode(z, edge_label_index).sigmoid()
     
-    return roc_auc_score(edge_label.cpu().numpy(), out.cpu().numpy())
+    if binary_auroc is not None:
+        # AUROC on device; .item() is the only host sync
+        return binary_auroc(out.float(), edge_label.long()).item()
+    return roc_auc_score(edge_label.float().cpu().numpy(), out.float().cpu().numpy())
 
 # --- 5. Main Execution ---
 
@@ -130,28 +158,56 @@ def main():
     val_data = val_data.to(device)
     test_data = test_data.to(device)
 
+    # Negative edges are sampled once up front (not on the CPU every epoch)
+    neg_pool = sample_negative_pool(train_data)
+    val_edges = label_edges(val_data, sample_negative_pool(val_data, factor=1))
+    test_edges = label_edges(test_data, sample_negative_pool(test_data, factor=1))
+
+    # Fixed-shape training buffers, allocated once; train() refills only the negative half
+    num_pos = train_data.edge_label_index.size(1)
+    train_buffers = (*label_edges(train_data, neg_pool[:, :num_pos]),
+                     torch.empty(num_pos, dtype=torch.long, device=device))
+
+    # Fuse the GCN message passing, relu, gather and dot-product decode into fewer kernels (PyTorch 2+).
+    # The training shapes are fixed (negatives come from the pool), so CUDA graphs can replay every epoch.
+    # GPU only: on CPU, Inductor needs a C++ toolchain and compile time outweighs this small training run.
+    eager_model = model
+    if device.type == 'cuda' and hasattr(torch, 'compile'):
+        torch._dynamo.config.cache_size_limit = 64
+        model = torch.compile(model, mode='reduce-overhead')
+
     print("\nStarting Training...")
     for epoch in range(1, 101):
-        loss = train(model, optimizer, train_data, criterion)
+        try:
+            loss = train(model, optimizer, train_data, criterion, neg_pool, train_buffers)
+        except Exception as e:
+            # Compilation happens lazily on the first call; fall back to eager if it fails
+            if model is eager_model:
+                raise
+            print(f"torch.compile failed ({e}); falling back to eager mode.")
+            model = eager_model
+            loss = train(model, optimizer, train_data, criterion, neg_pool, train_buffers)
         if epoch % 10 == 0:
-            val_auc = test(model, val_data)
+            val_auc = test(model, val_data, *val_edges)
             print(f'Epoch: {epoch:03d}, Loss: {loss:.4f}, Val AUC: {val_auc:.4f}')
 
     # 3. Final Evaluation
-    test_auc = test(model, test_data)
+    test_auc = test(model, test_data, *test_edges)
     print(f'\nFinal Test AUC: {test_auc:.4f}')
     
     # 4. Predict New Links (View G Application)
     print("\n--- View G: Predicting Missing Links ---")
-    z = model.encode(test_data.x, test_data.edge_index)
-    
-    # Let's take two random nodes and see if the model thinks they should be connected
-    node_a = 0
-    node_b = 5
-    
-    # Create a query edge
-    query_edge = torch.tensor([[node_a], [node_b]], device=device)
-    score = model.decode(z, query_edge).sigmoid().item()
+    model.eval()
+    with torch.inference_mode():
+        z = model.encode(test_data.x, test_data.edge_index)
+        
+        # Let's take two random nodes and see if the model thinks they should be connected
+        node_a = 0
+        node_b = 5
+        
+        # Create a query edge
+        query_edge = torch.tensor([[node_a], [node_b]], device=device)
+        score = model.decode(z, query_edge).sigmoid().item()
     
     print(f"Prediction for connection Node {node_a} -> Node {node_b}: {score:.4f}")
     if score > 0.8:
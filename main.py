@@ -1,18 +1,106 @@
 import os
 import logging
 import json
+import hashlib
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
 from dotenv import load_dotenv
 
 # Import components
 from extract_node import read_tex_file, extract_section, clean_latex
-from compute_similarity import compute_view_t_metrics, analyze_similarity
+from compute_similarity import (compute_view_t_metrics, analyze_similarity, get_cached_embeddings,
+                                similarity_matrix, MIN_WORDS_FOR_ENCODER)
 from graph_loader import GraphLoader
-from graph_rag import GraphRAG
+from graph_rag import GraphRAG, run_async
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+EXTRACT_CACHE_DIR = os.path.join("cache", "extract")
+# Bump when read_tex_file / extract_section / clean_latex / extract_paper change their output
+EXTRACTOR_VERSION = 1
+# One encoder for relation discovery, stored embeddings and GraphRAG queries (loaded once via shared_models)
+EMBEDDING_MODEL = 'all-MiniLM-L6-v2'
+
+def _tex_sources_hash(pdir):
+    """
+    SHA-256 over every .tex file under the paper directory, including sub-directories
+    (e.g. \\input{sections/intro}), salted with EXTRACTOR_VERSION.
+    """
+    digest = hashlib.sha256(f"extractor-v{EXTRACTOR_VERSION}\0".encode('utf-8'))
+    tex_paths = []
+    for root, _, files in os.walk(pdir):
+        tex_paths.extend(os.path.join(root, f) for f in files if f.endswith('.tex'))
+    for path in sorted(tex_paths):
+        digest.update(os.path.relpath(path, pdir).encode('utf-8') + b'\0')
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+def extract_paper(pid, pdir, tex_files):
+    """
+    Reads one paper's LaTeX source and builds its (simulated) structured node.
+    """
+    # Prefer 'main.tex' or 'acl_latex.tex' or the largest file
+    main_tex = next((f for f in tex_files if 'main' in f), tex_files[0])
+    full_text = read_tex_file(os.path.join(pdir, main_tex), pdir)
+    
+    # 2. Extract Sections
+    intro = clean_latex(extract_section(full_text, "Introduction") or "")
+    method = clean_latex(extract_section(full_text, "Methodology") or extract_section(full_text, "Capabilities") or "")
+    
+    # 3. Simulate LLM Output (Structured Node)
+    # In production, you would send 'intro' and 'method' to the prompts in prompts.md
+    return {
+        "id": pid,
+        "title": f"Simulated Title for {pid}", # In real app, extract from metadata
+        "year": 2025, # Placeholder
+        "problem_statement": intro[:500] + "...", # Truncated for demo
+        "core_method": method[:500] + "...",
+        "full_problem_text": intro, # Keep full text for embedding
+        "full_method_text": method
+    }
+
+def cached_extract(pid, pdir, cache_dir=EXTRACT_CACHE_DIR):
+    """
+    extract_paper behind an on-disk cache keyed by the hash of the paper's .tex sources.
+    Returns None if the directory has no .tex file.
+    """
+    # 1. Read LaTeX
+    # Heuristic: find the main tex file
+    tex_files = [f for f in os.listdir(pdir) if f.endswith('.tex')]
+    if not tex_files:
+        logger.warning(f"No .tex file found in {pdir}")
+        return None
+
+    cache_path = os.path.join(cache_dir, f"{pid}_{_tex_sources_hash(pdir)}.json")
+    if os.path.exists(cache_path):
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            logger.info(f"Loaded cached node for {pid}")
+            return json.load(f)
+
+    paper_node = extract_paper(pid, pdir, tex_files)
+
+    # Write to a temp file and rename, so an interrupted run never leaves a truncated entry
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(paper_node, f)
+    os.replace(tmp_path, cache_path)
+    return paper_node
+
+def _extract_one(item):
+    """
+    Process-pool worker: (pid, pdir) -> paper node or None.
+    """
+    pid, pdir = item
+    logger.info(f"Processing paper {pid}...")
+    paper_node = cached_extract(pid, pdir)
+    if paper_node is not None:
+        logger.info(f"Extracted node for {pid}")
+    return paper_node
+
 def step_1_extraction(paper_dirs):
     """
     Phase 1: Extract structured data from LaTeX source.
@@ -20,40 +108,16 @@ def step_1_extraction(paper_dirs):
     Here, we extract raw text and simulate the structured output.
     """
     logger.info("--- Phase 1: Node Extraction ---")
-    extracted_papers = []
 
-    for pid, pdir in paper_dirs.items():
-        logger.info(f"Processing paper {pid}...")
-        
-        # 1. Read LaTeX
-        # Heuristic: find the main tex file
-        tex_files = [f for f in os.listdir(pdir) if f.endswith('.tex')]
-        if not tex_files:
-            logger.warning(f"No .tex file found in {pdir}")
-            continue
-            
-        # Prefer 'main.tex' or 'acl_latex.tex' or the largest file
-        main_tex = next((f for f in tex_files if 'main' in f), tex_files[0])
-        full_text = read_tex_file(os.path.join(pdir, main_tex), pdir)
-        
-        # 2. Extract Sections
-        intro = clean_latex(extract_section(full_text, "Introduction") or "")
-        method = clean_latex(extract_section(full_text, "Methodology") or extract_section(full_text, "Capabilities") or "")
-        
-        # 3. Simulate LLM Output (Structured Node)
-        # In production, you would send 'intro' and 'method' to the prompts in prompts.md
-        paper_node = {
-            "id": pid,
-            "title": f"Simulated Title for {pid}", # In real app, extract from metadata
-            "year": 2025, # Placeholder
-            "problem_statement": intro[:500] + "...", # Truncated for demo
-            "core_method": method[:500] + "...",
-            "full_problem_text": intro, # Keep full text for embedding
-            "full_method_text": method
-        }
-        extracted_papers.append(paper_node)
-        logger.info(f"Extracted node for {pid}")
+    # LaTeX parsing is pure-Python CPU work, so fan papers out over processes (the GIL blocks threads)
+    items = list(paper_dirs.items())
+    if len(items) > 1:
+        with ProcessPoolExecutor(max_workers=min(len(items), os.cpu_count() or 1)) as executor:
+            results = list(executor.map(_extract_one, items))
+    else:
+        results = [_extract_one(item) for item in items]
 
+    extracted_papers = [p for p in results if p]
     return extracted_papers
 
 def step_2_relation_discovery(papers):
@@ -63,35 +127,52 @@ def step_2_relation_discovery(papers):
     logger.info("\n--- Phase 2: Relation Discovery ---")
     relations = []
     
-    # Compare every pair (O(N^2)) - For demo, we only have 2 papers
+    # Compare every pair (O(N^2)) with one embedding pass and one matrix product per section
     if len(papers) < 2:
         logger.warning("Not enough papers to compute relations.")
         return relations
 
-    p1 = papers[0]
-    p2 = papers[1]
-    
-    logger.info(f"Comparing {p1['id']} vs {p2['id']}...")
-    
-    # View T: Textual Similarity
-    data_a = {'problem': p1['full_problem_text'], 'method': p1['full_method_text']}
-    data_b = {'problem': p2['full_problem_text'], 'method': p2['full_method_text']}
+    n = len(papers)
+    logger.info(f"Comparing all {n * (n - 1) // 2} pairs of {n} papers...")
     
     # Note: This requires sentence-transformers installed
     try:
-        sim_prob, sim_meth = compute_view_t_metrics(data_a, data_b, model_name='all-MiniLM-L6-v2')
-        candidates = analyze_similarity(sim_prob, sim_meth)
-        
-        # Create a relation object
-        relation = {
-            "source_id": p1['id'],
-            "target_id": p2['id'],
-            "relation_type": candidates[0].split(" ")[0] if candidates else "Unrelated", # Simple heuristic
-            "confidence": (sim_prob + sim_meth) / 2,
-            "reasoning": f"Computed via View T. Problem Sim: {sim_prob:.2f}, Method Sim: {sim_meth:.2f}",
-            "source": "View T"
-        }
-        relations.append(relation)
+        # Papers with very short sections are scored with TF-IDF per pair (see compute_view_t_metrics),
+        # so only the remaining papers go through the transformer
+        short = {i for i, p in enumerate(papers)
+                 if min(len(p['full_problem_text'].split()), len(p['full_method_text'].split())) < MIN_WORDS_FOR_ENCODER}
+        encoded = [i for i in range(n) if i not in short]
+
+        # View T: Textual Similarity (embed each paper once, not once per pair)
+        sim_prob_all = np.zeros((n, n), dtype=np.float32)
+        sim_meth_all = np.zeros((n, n), dtype=np.float32)
+        if encoded:
+            m = len(encoded)
+            texts = [papers[i]['full_problem_text'] for i in encoded] + [papers[i]['full_method_text'] for i in encoded]
+            embeddings = get_cached_embeddings(texts, EMBEDDING_MODEL)
+            sim_prob_all[np.ix_(encoded, encoded)] = similarity_matrix(embeddings[:m])
+            sim_meth_all[np.ix_(encoded, encoded)] = similarity_matrix(embeddings[m:])
+
+        rows, cols = np.triu_indices(n, k=1)
+        for i, j, sim_prob, sim_meth in zip(rows, cols, sim_prob_all[rows, cols], sim_meth_all[rows, cols]):
+            p1, p2 = papers[i], papers[j]
+            if i in short or j in short:
+                data_a = {'problem': p1['full_problem_text'], 'method': p1['full_method_text']}
+                data_b = {'problem': p2['full_problem_text'], 'method': p2['full_method_text']}
+                sim_prob, sim_meth = compute_view_t_metrics(data_a, data_b, model_name=EMBEDDING_MODEL)
+            sim_prob, sim_meth = float(sim_prob), float(sim_meth)
+            candidates = analyze_similarity(sim_prob, sim_meth, verbose=n == 2)
+            
+            # Create a relation object
+            relation = {
+                "source_id": p1['id'],
+                "target_id": p2['id'],
+                "relation_type": candidates[0].split(" ")[0] if candidates else "Unrelated", # Simple heuristic
+                "confidence": (sim_prob + sim_meth) / 2,
+                "reasoning": f"Computed via View T. Problem Sim: {sim_prob:.2f}, Method Sim: {sim_meth:.2f}",
+                "source": "View T"
+            }
+            relations.append(relation)
         
     except Exception as e:
         logger.error(f"Failed to compute similarity: {e}")
@@ -112,16 +193,22 @@ def step_3_storage(papers, relations):
         loader = GraphLoader(uri, user, password)
         loader.setup_schema()
         
-        # Load Papers
-        for p in papers:
-            # Generate dummy embeddings if not present (GraphLoader expects them)
-            # In real app, compute them here or in Step 2
-            p['embedding_problem'] = [0.1] * 384 
-            p['embedding_method'] = [0.1] * 384
+        # Embed all Problem / Method texts in two batched calls (same model GraphRAG queries with);
+        # with no papers there is nothing to encode, but the schema and relations still load
+        if papers:
+            prob_embs = get_cached_embeddings([p['full_problem_text'] for p in papers], EMBEDDING_MODEL)
+            meth_embs = get_cached_embeddings([p['full_method_text'] for p in papers], EMBEDDING_MODEL)
+
+        # Load Papers (batched UNWIND writes instead of one round-trip per paper)
+        db_nodes = []
+        for i, p in enumerate(papers):
+            # float32 rows; GraphLoader converts them to lists once, at the driver boundary
+            p['embedding_problem'] = prob_embs[i]
+            p['embedding_method'] = meth_embs[i]
             
             # Remove full text fields before loading to DB to save space/cleanliness if needed
             # or keep them. GraphLoader expects specific keys.
-            db_node = {
+            db_nodes.append({
                 "id": p['id'],
                 "title": p['title'],
                 "year": p['year'],
@@ -132,21 +219,21 @@ def step_3_storage(papers, relations):
                 "key_findings": "Simulated findings",
                 "embedding_problem": p['embedding_problem'],
                 "embedding_method": p['embedding_method']
-            }
-            loader.add_paper(db_node)
+            })
+        loader.add_papers_batch(db_nodes)
             
         # Load Relations
-        for r in relations:
-            loader.add_semantic_relation(
-                r['source_id'], 
-                r['target_id'], 
-                {
-                    "relation_type": r['relation_type'],
-                    "confidence": float(r['confidence']),
-                    "reasoning": r['reasoning'],
-                    "source": r['source']
-                }
-            )
+        loader.add_semantic_relations_batch([
+            {
+                "source_id": r['source_id'],
+                "target_id": r['target_id'],
+                "relation_type": r['relation_type'],
+                "confidence": float(r['confidence']),
+                "reasoning": r['reasoning'],
+                "source": r['source']
+            }
+            for r in relations
+        ])
             
         loader.close()
         logger.info("Data successfully loaded into Neo4j.")
@@ -168,17 +255,20 @@ def step_4_reasoning():
     password = os.getenv("NEO4J_PASSWORD", "password")
     
     try:
-        rag = GraphRAG(uri, user, password)
-        query = "How do these papers relate to each other?"
-        
-        logger.info(f"Running Query: {query}")
-        # This will fail if DB is empty/unreachable, handled by try/except
-        rag.run_pipeline(query)
-        rag.close()
+        run_async(_run_query(uri, user, password, "How do these papers relate to each other?"))
         
     except Exception as e:
         logger.error(f"GraphRAG Failed: {e}")
 
+async def _run_query(uri, user, password, query):
+    rag = GraphRAG(uri, user, password, embedding_model_name=EMBEDDING_MODEL)
+    try:
+        logger.info(f"Running Query: {query}")
+        # This will fail if DB is empty/unreachable, handled by try/except
+        await rag.run_pipeline(query)
+    finally:
+        await rag.close()
+
 def main():
     load_dotenv()
     
@@ -0,0 +1,135 @@
+"""
+Encoder loading shared by compute_similarity.py, main.py and graph_rag.py.
+
+load_model is cached per process, so every module asking for the same model name gets
+the same instance (one copy of the weights in RAM / VRAM).
+"""
+
+import os
+import json
+import functools
+import numpy as np
+
+ONNX_MODEL_FILE = 'model_int8.onnx'
+ONNX_CONFIG_FILE = 'encoder_config.json'
+
+def onnx_model_dir(model_name, base_dir='onnx_models'):
+    """
+    Directory holding the ONNX export of a model (see export_to_onnx.py).
+    """
+    return os.path.join(base_dir, model_name.replace('/', '_'))
+
+class OnnxEncoder:
+    """
+    Minimal stand-in for SentenceTransformer.encode backed by an ONNX Runtime session.
+    """
+    def __init__(self, model_dir, providers=None):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        with open(os.path.join(model_dir, ONNX_CONFIG_FILE)) as f:
+            config = json.load(f)
+        self.pooling = config['pooling']
+        self.max_seq_length = config['max_seq_length']
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.session = ort.InferenceSession(
+            os.path.join(model_dir, ONNX_MODEL_FILE),
+            providers=providers or ['CPUExecutionProvider']
+        )
+
+    def encode(self, sentences, batch_size=32, normalize_embeddings=False, **kwargs):
+        single = isinstance(sentences, str)
+        if single:
+            sentences = [sentences]
+
+        # Longest texts first so each batch pads to a similar length
+        order = np.argsort([-len(s) for s in sentences], kind='stable')
+        batches = []
+        for start in range(0, len(sentences), batch_size):
+            batch = [sentences[i] for i in order[start:start + batch_size]]
+            tokens = self.tokenizer(batch, padding='longest', truncation=True,
+                                    max_length=self.max_seq_length, return_tensors='np')
+            attention_mask = tokens['attention_mask'].astype(np.int64)
+            hidden = self.session.run(None, {
+                'input_ids': tokens['input_ids'].astype(np.int64),
+                'attention_mask': attention_mask
+            })[0]
+
+            if self.pooling == 'cls':
+                pooled = hidden[:, 0]
+            else:
+                # Mean pooling over real tokens, as in SentenceTransformer's Pooling layer
+                mask = attention_mask[..., None].astype(hidden.dtype)
+                pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            batches.append(pooled)
+
+        embeddings = np.empty((len(sentences), batches[0].shape[1]), dtype=np.float32)
+        embeddings[order] = np.concatenate(batches)
+        if normalize_embeddings:
+            embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+        return embeddings[0] if single else embeddings
+
+def optimize_for_inference(model):
+    """
+    Runs the model in FP16 on GPU, or with dynamically quantized INT8 Linear layers on CPU.
+    """
+    import torch
+
+    # Use every core for CPU inference (PyTorch defaults can leave cores idle)
+    torch.set_num_threads(os.cpu_count() or 4)
+    if torch.cuda.is_available():
+        return model.half()
+    # Embedding layers stay FP32: dynamic qint8 quantization only supports Linear
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+
+def _cuda_available():
+    try:
+        import torch
+    except ImportError:
+        return False
+    return torch.cuda.is_available()
+
+def encoder_backend(model_name):
+    """
+    Backend load_model picks for model_name on this host: 'onnx-int8', 'torch-fp16' or 'torch-int8'.
+    Each produces slightly different vectors, so embedding caches key on it.
+    """
+    if _cuda_available():
+        return 'torch-fp16'
+    if os.path.exists(os.path.join(onnx_model_dir(model_name), ONNX_MODEL_FILE)):
+        return 'onnx-int8'
+    return 'torch-int8'
+
+@functools.lru_cache(maxsize=4)
+def load_model(model_name):
+    """
+    Loads the encoder for model_name. Returns (model, name of the model actually loaded).
+    Cached per process, so every caller asking for model_name shares one instance.
+    """
+    onnx_dir = onnx_model_dir(model_name)
+    if encoder_backend(model_name) == 'onnx-int8':
+        # On CPU prefer the quantized ONNX export (python export_to_onnx.py <model_name>);
+        # on GPU the FP16 PyTorch path below is faster than the CPU-oriented INT8 graph
+        print(f"Loading ONNX model: {onnx_dir}...")
+        return OnnxEncoder(onnx_dir), model_name
+
+    # Imported here so cache hits and ONNX runs never pull in torch / sklearn / transformers
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    device = 'cuda' if torch.cuda.is_available() else 'cpu'
+    print(f"Loading model: {model_name} (device: {device})...")
+    try:
+        model = SentenceTransformer(model_name, device=device)
+    except Exception as e:
+        print(f"Error loading {model_name}: {e}")
+        print("Falling back to 'all-MiniLM-L6-v2'")
+        model_name = 'all-MiniLM-L6-v2'
+        model = SentenceTransformer(model_name, device=device)
+    return optimize_for_inference(model), model_name
+
+def get_st_model(model_name):
+    """
+    Returns the shared encoder instance for model_name (SentenceTransformer or OnnxEncoder).
+    """
+    return load_model(model_name)[0]